@@ -0,0 +1,9 @@
+# gunicorn_conf.py
+# Production server config for the Flask API. Launch with:
+#     gunicorn -c gunicorn_conf.py main:app
+import multiprocessing
+
+bind = "0.0.0.0:80"
+worker_class = "gevent"
+worker_connections = 1000
+workers = 2 * multiprocessing.cpu_count() + 1
@@ -9,12 +9,15 @@ def hello():
 
 @app.route("/api/echo", methods=["POST"])
 def echo():
-    data = request.json
+    # cache=False: the payload is echoed once and never re-read, so
+    # skip Flask's per-request JSON cache.
+    data = request.get_json(cache=False)
     return jsonify({"you_sent": data})
 
 @app.route("/api/ping", methods=["GET"])
 def ping():
     return jsonify({"status": "ok"})
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80)
+# Served by gunicorn in production (single-threaded dev server can't
+# handle concurrent requests):
+#     gunicorn -c gunicorn_conf.py main:app